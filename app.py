@@ -1,15 +1,20 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
-import json
+import plotly.io as pio
+import hashlib
 import numpy as np
+import orjson
 import os
+import pickle
 import warnings
 
 # Suppress warnings
 warnings.filterwarnings('ignore')
 
+# Serialize figures with orjson (already a dependency) instead of relying on auto-detection
+pio.json.config.default_engine = 'orjson'
+
 # Set page config
 st.set_page_config(
     page_title="NYC Heat Vulnerability Index",
@@ -44,6 +49,13 @@ st.markdown("""
         box-shadow: 2px 2px 5px rgba(0,0,0,0.1);
         text-align: center;
     }
+    .stat-row {
+        display: flex;
+        gap: 10px;
+    }
+    .stat-row .stat-box {
+        flex: 1;
+    }
     .legend-title {
         font-weight: bold;
         margin-bottom: 5px;
@@ -54,77 +66,306 @@ st.markdown("""
 # Title and introduction
 st.markdown("## NYC Heat Vulnerability Index Map")
 
-# Load data
-@st.cache_data
-def load_data():
-    try:
-        # Try to read the CSV file directly
+# Pre-processed copies of the source files are kept under the user's cache
+# directory, which survives restarts on hosts that clear the temp directory
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'nyc-hvi')
+
+def is_cache_fresh(cache_path, source_path):
+    """
+    Check that a cached copy exists and is at least as new as its source file.
+    """
+    return os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(source_path)
+
+# Source column names in the DOHMH CSV
+ZIP_COLUMN = 'ZIP Code Tabulation Area (ZCTA) 2020'
+HVI_COLUMN = 'Heat Vulnerability Index (HVI)'
+
+def read_hvi_csv(path):
+    """
+    Read only the zip code and HVI columns with pyarrow's multithreaded reader.
+    Zip codes are read as strings to skip type inference; HVI is validated
+    and downcast in load_data.
+
+    A Parquet copy of the result is kept in the cache directory and read
+    instead of the CSV while it is up to date.
+    """
+    parquet_path = os.path.join(CACHE_DIR, os.path.basename(path) + '.parquet')
+    if is_cache_fresh(parquet_path, path):
         try:
-            df = pd.read_csv('Heat_Vulnerability_Index_Rankings_20250406.csv')
-        except FileNotFoundError:
-            # If file is not found in the current directory, try with a path
-            st.warning("CSV file not found in current directory, trying with a direct path...")
-            # The CSV might be uploaded differently depending on the deployment environment
-            import os
-            possible_paths = [
-                './Heat_Vulnerability_Index_Rankings_20250406.csv',
-                '../Heat_Vulnerability_Index_Rankings_20250406.csv',
-                '/app/Heat_Vulnerability_Index_Rankings_20250406.csv'
-            ]
-            
-            df = None
-            for path in possible_paths:
-                if os.path.exists(path):
-                    df = pd.read_csv(path)
-                    break
-            
-            if df is None:
-                # If still not found, create dummy data for demonstration
-                st.error("Could not find the CSV file. Using sample data for demonstration.")
-                return pd.DataFrame({
-                    'zipcode': [10001, 10002, 10003, 10004, 10005, 10006, 
-                                10007, 10009, 10010, 10011, 10012, 10013],
-                    'hvi': [5, 3, 2, 4, 1, 5, 2, 3, 4, 5, 1, 2]
-                })
+            return pd.read_parquet(parquet_path, engine='pyarrow')
+        except Exception:
+            # Unreadable cache, fall back to parsing the CSV
+            pass
+
+    df = pd.read_csv(
+        path,
+        engine='pyarrow',
+        usecols=[ZIP_COLUMN, HVI_COLUMN],
+        dtype={ZIP_COLUMN: 'string'}
+    )
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        df.to_parquet(parquet_path, engine='pyarrow', index=False)
+    except Exception:
+        # The cache is only an optimization
+        pass
+
+    return df
+
+# Places the CSV might be, depending on the deployment environment
+CSV_PATHS = [
+    'Heat_Vulnerability_Index_Rankings_20250406.csv',
+    '../Heat_Vulnerability_Index_Rankings_20250406.csv',
+    '/app/Heat_Vulnerability_Index_Rankings_20250406.csv'
+]
+
+def sample_data():
+    """
+    Small sample table used for demonstration when the real data can't be loaded.
+    """
+    return pd.DataFrame({
+        'zipcode': [10001, 10002, 10003, 10004, 10005, 10006, 
+                    10007, 10009, 10010, 10011, 10012, 10013],
+        'hvi': [5, 3, 2, 4, 1, 5, 2, 3, 4, 5, 1, 2]
+    })
+
+# Read the raw HVI table, falling back to sample data
+def read_data():
+    try:
+        # Probe the known locations once and read the first CSV found
+        csv_path = next((path for path in CSV_PATHS if os.path.exists(path)), None)
+        if csv_path is None:
+            # If the file isn't anywhere, create dummy data for demonstration
+            st.error("Could not find the CSV file. Using sample data for demonstration.")
+            return sample_data()
+
+        df = read_hvi_csv(csv_path)
         
         # Rename columns to more readable names if needed
-        if 'ZIP Code Tabulation Area (ZCTA) 2020' in df.columns and 'Heat Vulnerability Index (HVI)' in df.columns:
+        if ZIP_COLUMN in df.columns and HVI_COLUMN in df.columns:
             df = df.rename(columns={
-                'ZIP Code Tabulation Area (ZCTA) 2020': 'zipcode',
-                'Heat Vulnerability Index (HVI)': 'hvi'
+                ZIP_COLUMN: 'zipcode',
+                HVI_COLUMN: 'hvi'
             })
         
         return df
     except Exception as e:
         st.error(f"Error loading data: {e}")
         # Create sample data for demonstration
-        return pd.DataFrame({
-            'zipcode': [10001, 10002, 10003, 10004, 10005, 10006, 
-                        10007, 10009, 10010, 10011, 10012, 10013],
-            'hvi': [5, 3, 2, 4, 1, 5, 2, 3, 4, 5, 1, 2]
-        })
+        return sample_data()
 
-# Load NYC GeoJSON
+# Load data
 @st.cache_data
+def load_data():
+    """
+    Load the HVI table along with summary statistics used by the sidebar and maps.
+    Returns None for the statistics if the table lacks the zipcode or hvi column.
+    """
+    df = read_data()
+    # Validate the schema once so the rest of the app can rely on both columns
+    if not {'zipcode', 'hvi'}.issubset(df.columns):
+        return df, None
+
+    # Normalize zip codes once here so every rerun gets them from the cache
+    df['zipcode'] = df['zipcode'].astype('string').str.zfill(5).astype('category')
+
+    # HVI is a 1-5 score, so uint8 is plenty and keeps comparisons cheap
+    df['hvi'] = pd.to_numeric(df['hvi'], errors='coerce')
+    df = df.dropna(subset=['hvi'])
+    if df.empty:
+        return df, None
+    df['hvi'] = df['hvi'].astype('uint8')
+
+    # Precompute the HVI statistics once instead of scanning the column on every rerun
+    hvi = df['hvi'].to_numpy()
+    stats = {
+        'min': int(hvi.min()),
+        'max': int(hvi.max()),
+        'high_risk': int((hvi >= 4).sum())
+    }
+    return df, stats
+
+# Pre-processed copy of GeoJSON.json, reused across cold starts.
+# Bump the version whenever the processing below changes.
+GEOJSON_CACHE_VERSION = 4
+GEOJSON_PICKLE_PATH = os.path.join(CACHE_DIR, f'nyc_zipcodes.v{GEOJSON_CACHE_VERSION}.geojson.pkl')
+
+# Simplification tolerance in degrees (~50 m), below one pixel at the default zoom
+GEOJSON_SIMPLIFY_TOLERANCE = 0.0005
+# Decimal places kept on coordinates (~1 m)
+GEOJSON_COORDINATE_DECIMALS = 5
+
+def simplify_geojson(geojson_data, tolerance=GEOJSON_SIMPLIFY_TOLERANCE,
+                     decimals=GEOJSON_COORDINATE_DECIMALS):
+    """
+    Simplify the geometry of every feature in place and round its coordinates
+    to cut the number of bytes sent to the browser.
+    """
+    # Imported here since it is only needed when the pickled cache is missing
+    import shapely
+    from shapely.geometry import mapping, shape
+
+    features = geojson_data['features']
+    geometries = shapely.simplify(
+        [shape(feature['geometry']) for feature in features],
+        tolerance,
+        preserve_topology=True
+    )
+    geometries = shapely.transform(geometries, lambda coords: np.round(coords, decimals))
+    for feature, geometry in zip(features, geometries):
+        feature['geometry'] = mapping(geometry)
+    return geojson_data
+
+def get_zipcode_property(geojson):
+    """
+    Find the feature property that holds the zip code.
+    """
+    properties = geojson['features'][0].get('properties', {}) if geojson.get('features') else {}
+    # Check for different potential zipcode property names
+    for key in ('postalCode', 'ZIPCODE', 'ZIP'):
+        if key in properties:
+            return key
+    return 'ZCTA5CE10'
+
+def set_feature_ids(geojson_data):
+    """
+    Copy each feature's zip code to its top-level id so Plotly can match
+    locations with the default featureidkey='id'.
+    """
+    zip_property = get_zipcode_property(geojson_data)
+    for feature in geojson_data['features']:
+        zipcode = feature.get('properties', {}).get(zip_property)
+        feature['id'] = str(zipcode) if zipcode is not None else None
+    return geojson_data
+
+def is_valid_geojson(data):
+    """
+    Cheap top-level check that data is a non-empty FeatureCollection; the
+    parsers already guarantee the nested types.
+    """
+    return (
+        isinstance(data, dict)
+        and data.get('type') == 'FeatureCollection'
+        and isinstance(data.get('features'), list)
+        and len(data['features']) > 0
+    )
+
+# Load NYC GeoJSON
+# cache_resource hands back the same object on every rerun instead of
+# hashing and unpickling the whole FeatureCollection, so treat it as read-only
+@st.cache_resource
 def load_nyc_geojson():
     """
     Load NYC GeoJSON from local file.
+
+    Each feature's id is set to its zip code. The parsed and simplified
+    object is pickled to the cache directory so later cold starts can skip
+    parsing the JSON text.
     """
     try:
-        with open('GeoJSON.json', 'r') as f:
-            geojson_data = json.load(f)
+        # Use the pickled copy if it is at least as new as the source file
+        if is_cache_fresh(GEOJSON_PICKLE_PATH, 'GeoJSON.json'):
+            try:
+                with open(GEOJSON_PICKLE_PATH, 'rb') as f:
+                    geojson_data = pickle.load(f)
+                if is_valid_geojson(geojson_data):
+                    return geojson_data
+            except Exception:
+                # Unreadable cache, fall back to parsing the JSON file
+                pass
+
+        # orjson parses straight from bytes, skipping the text decode
+        with open('GeoJSON.json', 'rb') as f:
+            geojson_data = orjson.loads(f.read())
+        if not is_valid_geojson(geojson_data):
+            raise ValueError("GeoJSON.json is not a non-empty FeatureCollection")
+        simplify_geojson(geojson_data)
+        set_feature_ids(geojson_data)
+
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(GEOJSON_PICKLE_PATH, 'wb') as f:
+                pickle.dump(geojson_data, f, protocol=5)
+        except OSError:
+            # The cache is only an optimization
+            pass
+
         return geojson_data
     except Exception as e:
         st.error(f"Failed to load local GeoJSON file: {e}")
         return None
 
+# Trim the GeoJSON to the zip codes in the data
+@st.cache_resource
+def prune_geojson(_geojson, zipcodes):
+    """
+    Return a copy of the GeoJSON with only the given zip codes. Properties are
+    dropped since features are matched by id, so less data is shipped to the browser.
+    """
+    keep = set(zipcodes)
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'id': feature['id'],
+                'properties': {},
+                'geometry': feature['geometry']
+            }
+            for feature in _geojson['features']
+            if feature['id'] in keep
+        ]
+    }
+
+# Load NYC zip code centroids
+@st.cache_data
+def load_zip_centroids():
+    """
+    Load zip code centroids as a table indexed by zip code with separate lat
+    and lon columns, ready for vectorized lookups.
+    """
+    with open('nyc_zip_centroids.json', 'rb') as f:
+        nyc_zip_centroids = orjson.loads(f.read())
+    return pd.DataFrame.from_dict(nyc_zip_centroids, orient='index', columns=['lat', 'lon'])
+
+# File name of the GeoJSON served from the app's static folder
+STATIC_GEOJSON_NAME = 'nyc_zcta.json'
+
+# Serve the GeoJSON as a static file so the browser can cache it across reruns
+@st.cache_resource
+def publish_geojson(_geojson, zipcodes):
+    """
+    Write the pruned GeoJSON into the app's static folder and return a URL
+    Plotly can load it from, or None if static serving is unavailable.
+    """
+    if not st.get_option('server.enableStaticServing'):
+        return None
+    try:
+        payload = orjson.dumps(_geojson)
+        static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+        os.makedirs(static_dir, exist_ok=True)
+        with open(os.path.join(static_dir, STATIC_GEOJSON_NAME), 'wb') as f:
+            f.write(payload)
+    except OSError:
+        return None
+    # Version the URL by content so the browser only refetches when it changes
+    return f"app/static/{STATIC_GEOJSON_NAME}?v={hashlib.md5(payload).hexdigest()[:12]}"
+
 # Load data
-df = load_data()
+df, hvi_stats = load_data()
+if hvi_stats is None:
+    st.error("The HVI data needs a zip code and an HVI column with at least one valid row.")
+    st.stop()
+
 nyc_geojson = load_nyc_geojson()
 
-# Convert zipcode to string if it's numeric
-if 'zipcode' in df.columns and pd.api.types.is_numeric_dtype(df['zipcode']):
-    df['zipcode'] = df['zipcode'].astype(str)
+geojson_source = None
+if nyc_geojson is not None:
+    data_zipcodes = tuple(sorted(df['zipcode'].unique()))
+    nyc_geojson = prune_geojson(nyc_geojson, data_zipcodes)
+    # Prefer the static URL so the geometry is not embedded in every figure
+    geojson_source = publish_geojson(nyc_geojson, data_zipcodes) or nyc_geojson
 
 # Sidebar
 st.sidebar.header("Visualization Controls")
@@ -132,13 +373,23 @@ st.sidebar.header("Visualization Controls")
 # Filter by vulnerability level
 vulnerability_filter = st.sidebar.slider(
     "Filter by Vulnerability Index Range",
-    int(df['hvi'].min() if 'hvi' in df.columns else 1),
-    int(df['hvi'].max() if 'hvi' in df.columns else 5),
-    (int(df['hvi'].min() if 'hvi' in df.columns else 1), int(df['hvi'].max() if 'hvi' in df.columns else 5))
+    hvi_stats['min'],
+    hvi_stats['max'],
+    (hvi_stats['min'], hvi_stats['max'])
 )
 
 # Apply filter
-filtered_df = df[(df['hvi'] >= vulnerability_filter[0]) & (df['hvi'] <= vulnerability_filter[1])]
+@st.cache_data
+def filter_by_hvi(_df, lo, hi):
+    """
+    Return the rows whose HVI lies within [lo, hi].
+
+    The frame comes from load_data and never changes within a session, so
+    only the slider range is hashed.
+    """
+    # Build the mask on the underlying array in a single pass
+    hvi = _df['hvi'].to_numpy()
+    return _df[np.logical_and(hvi >= lo, hvi <= hi)]
 
 # Visualization type
 viz_type = st.sidebar.radio(
@@ -154,24 +405,19 @@ color_scale = st.sidebar.selectbox(
 
 # Display statistics
 st.sidebar.header("Heat Vulnerability Statistics")
-if 'hvi' in df.columns:
-    col1, col2 = st.sidebar.columns(2)
-    with col1:
-        st.markdown(
-            f"""<div class="stat-box">
-                <h3>{int(df['hvi'].max())}</h3>
-                <p>Highest HVI<br>(HVI = 5)</p>
-            </div>""", 
-            unsafe_allow_html=True
-        )
-    with col2:
-        st.markdown(
-            f"""<div class="stat-box">
-                <h3>{len(df[df['hvi'] >= 4])}</h3>
-                <p>High Risk Zip<br>(HVI ≥ 4)</p>
-            </div>""", 
-            unsafe_allow_html=True
-        )
+st.sidebar.markdown(
+    f"""<div class="stat-row">
+        <div class="stat-box">
+            <h3>{hvi_stats['max']}</h3>
+            <p>Highest HVI<br>(HVI = 5)</p>
+        </div>
+        <div class="stat-box">
+            <h3>{hvi_stats['high_risk']}</h3>
+            <p>High Risk Zip<br>(HVI ≥ 4)</p>
+        </div>
+    </div>""",
+    unsafe_allow_html=True
+)
 
 # Information about heat vulnerability
 st.sidebar.markdown("<br>", unsafe_allow_html=True)
@@ -187,134 +433,116 @@ with st.sidebar.expander("What is Heat Vulnerability?"):
         Higher values indicate areas that need more resources during heat events.
     """)
 
+# Build the choropleth figure, reusing it across reruns with the same inputs
+@st.cache_resource
+def build_choropleth(lo, hi, color_scale, hvi_max, _df, _geojson):
+    """
+    Build the choropleth map for the HVI range [lo, hi]. The frame and the
+    GeoJSON (a dict or a URL to load it from) are already cached and are not
+    hashed, so the key is just the slider range and color scale.
+    """
+    filtered = filter_by_hvi(_df, lo, hi)
+    fig = go.Figure(go.Choroplethmapbox(
+        geojson=_geojson,
+        locations=filtered['zipcode'].to_numpy(dtype=object),
+        z=filtered['hvi'].to_numpy(dtype=np.uint8),
+        featureidkey='id',
+        colorscale=color_scale,
+        zmin=1,
+        zmax=hvi_max,
+        marker_opacity=0.7,
+        hovertemplate='<b>%{location}</b><br>Heat Vulnerability Index=%{z}<extra></extra>',
+        colorbar={
+            'title': 'Heat Vulnerability Index',
+            'tickvals': [1, 2, 3, 4, 5],
+            'ticktext': ['1 (Low)', '2', '3', '4', '5 (High)']
+        }
+    ))
+
+    fig.update_layout(
+        mapbox_style="carto-positron",
+        mapbox_zoom=9.5,
+        mapbox_center={"lat": 40.7128, "lon": -74.0060},
+        margin={"r": 0, "t": 0, "l": 0, "b": 0},
+        height=600
+    )
+    return fig
+
+# Build the heat map figure, reusing it across reruns with the same inputs
+@st.cache_resource
+def build_heatmap(lo, hi, color_scale, hvi_max, _df):
+    """
+    Build a density heat map for the HVI range [lo, hi] using actual NYC zip
+    code locations.
+    """
+    filtered = filter_by_hvi(_df, lo, hi)
+
+    # Look up every zip code's lat/long in one pass, with a default fallback to central Manhattan
+    zip_locations = load_zip_centroids().reindex(filtered['zipcode'].astype(str))
+    # float32 keeps sub-metre precision and halves the coordinate payload
+    zip_lats = zip_locations['lat'].fillna(40.7128).to_numpy(dtype=np.float32)
+    zip_lons = zip_locations['lon'].fillna(-74.0060).to_numpy(dtype=np.float32)
+    
+    # One point per zip code weighted by its HVI; the density kernel's radius
+    # does the smoothing, so no extra jittered points are needed
+    fig = go.Figure(go.Densitymapbox(
+        lat=zip_lats,
+        lon=zip_lons,
+        z=filtered['hvi'].to_numpy(dtype=np.uint8),
+        radius=25,  # Wide enough to blend neighbouring zip codes
+        colorscale=color_scale,
+        zmin=1,
+        zmax=hvi_max,
+        showscale=True,
+        colorbar=dict(
+            title='Heat Vulnerability',
+            tickvals=[1, 2, 3, 4, 5],
+            ticktext=['1 (Low)', '2', '3', '4', '5 (High)']
+        )
+    ))
+    
+    fig.update_layout(
+        mapbox_style="carto-positron",
+        mapbox_center_lat=40.7128,
+        mapbox_center_lon=-74.0060,
+        mapbox_zoom=10,
+        margin={"r": 0, "t": 0, "l": 0, "b": 0},
+        height=600
+    )
+    return fig
+
 # Main content area - Map section (full width)
+choropleth_failed = False
 if viz_type == "Choropleth Map" and nyc_geojson is not None:
     # Create choropleth map
     try:
-        # First attempt with standard property keys
-        feature_id_key = "properties.ZCTA5CE10"
-        # Check if we need to use a different property key based on the GeoJSON structure
-        if nyc_geojson and 'features' in nyc_geojson and len(nyc_geojson['features']) > 0:
-            first_feature = nyc_geojson['features'][0]
-            if 'properties' in first_feature:
-                properties = first_feature['properties']
-                # Check for different potential zipcode property names
-                if 'postalCode' in properties:
-                    feature_id_key = "properties.postalCode"
-                elif 'ZIPCODE' in properties:
-                    feature_id_key = "properties.ZIPCODE"
-                elif 'ZIP' in properties:
-                    feature_id_key = "properties.ZIP"
-                
-        fig = px.choropleth_mapbox(
-            filtered_df,
-            geojson=nyc_geojson,
-            locations='zipcode',
-            featureidkey=feature_id_key,
-            color='hvi',
-            color_continuous_scale=color_scale,
-            range_color=(1, int(df['hvi'].max() if 'hvi' in df.columns else 5)),
-            mapbox_style="carto-positron",
-            zoom=9.5,
-            center={"lat": 40.7128, "lon": -74.0060},
-            opacity=0.7,
-            labels={'hvi': 'Heat Vulnerability Index'},
-            hover_name='zipcode',
-            hover_data={
-                'zipcode': True,
-                'hvi': True
-            }
+        fig = build_choropleth(
+            *vulnerability_filter,
+            color_scale,
+            hvi_stats['max'],
+            df,
+            geojson_source
         )
+        st.plotly_chart(fig, use_container_width=True)
     except Exception as e:
         st.error(f"Error creating choropleth map: {e}")
-        # Fallback to simple scatter plot if choropleth fails
-        st.info("Falling back to scatter plot visualization.")
-        viz_type = "Scatter Plot with Zip Code Labels"
-        
-    # Update layout
-    fig.update_layout(
-        margin={"r": 0, "t": 0, "l": 0, "b": 0},
-        coloraxis_colorbar={
-            'title': 'Heat Vulnerability Index',
-            'tickvals': [1, 2, 3, 4, 5],
-            'ticktext': ['1 (Low)', '2', '3', '4', '5 (High)']
-        },
-        height=600
+        # Fall through to the heat map below if the choropleth fails
+        st.info("Falling back to heat map visualization.")
+        choropleth_failed = True
+
+if viz_type == "Heat Map" or (viz_type == "Choropleth Map" and (nyc_geojson is None or choropleth_failed)):
+    # Show notification if this is being used as a fallback
+    if viz_type == "Choropleth Map" and nyc_geojson is None:
+        st.info("Using heat map as a fallback because GeoJSON data couldn't be loaded.")
+    
+    fig = build_heatmap(
+        *vulnerability_filter,
+        color_scale,
+        hvi_stats['max'],
+        df
     )
     
     st.plotly_chart(fig, use_container_width=True)
-        
-elif viz_type == "Heat Map" or (viz_type == "Choropleth Map" and nyc_geojson is None):
-    # Create a density heat map using actual NYC zip code locations
-    if 'zipcode' in filtered_df.columns:
-        # Show notification if this is being used as a fallback
-        if viz_type == "Choropleth Map" and nyc_geojson is None:
-            st.info("Using heat map as a fallback because GeoJSON data couldn't be loaded.")
-        
-        # Load NYC zip code centroids data
-        with open('nyc_zip_centroids.json', 'r') as f:
-            nyc_zip_centroids = json.load(f)
-        
-        # Function to get lat/long for a zipcode, with a default fallback to central Manhattan
-        def get_zip_location(zipcode):
-            # Convert to string if it's a number
-            zipcode = str(zipcode)
-            # Return the known location or a default location in central NYC
-            return nyc_zip_centroids.get(zipcode, (40.7128, -74.0060))  # Default to NYC center
-        
-        # Create multiple points based on heat value for better density visualization
-        densified_lats = []
-        densified_lons = []
-        densified_values = []
-        
-        for _, row in filtered_df.iterrows():
-            zipcode = str(row['zipcode'])
-            hvi = row['hvi']
-            lat, lon = get_zip_location(zipcode)
-            
-            # Add multiple points for each zip code based on its HVI value
-            # Higher HVI means more points = hotter on the heatmap
-            num_points = max(5, hvi * 3)  # At least 5 points, more for higher HVI
-            
-            # Add slight randomness to the points to create a more natural heat map
-            for _ in range(int(num_points)):
-                # Add jitter (small random offsets) to spread out the points
-                jitter_lat = lat + np.random.normal(0, 0.003)  # ~0.3 km jitter
-                jitter_lon = lon + np.random.normal(0, 0.003)
-                
-                densified_lats.append(jitter_lat)
-                densified_lons.append(jitter_lon)
-                densified_values.append(hvi)
-        
-        # Create the heatmap with densified points
-        fig = go.Figure(go.Densitymapbox(
-            lat=densified_lats,
-            lon=densified_lons,
-            z=densified_values,
-            radius=15,  # Increased radius for better visibility
-            colorscale=color_scale,
-            zmin=1,
-            zmax=int(df['hvi'].max() if 'hvi' in df.columns else 5),
-            showscale=True,
-            colorbar=dict(
-                title='Heat Vulnerability',
-                tickvals=[1, 2, 3, 4, 5],
-                ticktext=['1 (Low)', '2', '3', '4', '5 (High)']
-            )
-        ))
-        
-        fig.update_layout(
-            mapbox_style="carto-positron",
-            mapbox_center_lat=40.7128,
-            mapbox_center_lon=-74.0060,
-            mapbox_zoom=10,
-            margin={"r": 0, "t": 0, "l": 0, "b": 0},
-            height=600
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.error("Heat map data is not available.")
 
 # Add context for the visualization
 st.markdown("""
@@ -392,9 +620,14 @@ st.markdown("""
 """)
 
 # Add the ability to download the filtered data
+@st.cache_data
+def to_csv_bytes(_df, lo, hi):
+    return filter_by_hvi(_df, lo, hi).to_csv(index=False).encode('utf-8')
+
 st.download_button(
     label="Download filtered data as CSV",
-    data=filtered_df.to_csv(index=False).encode('utf-8'),
+    data=to_csv_bytes(df, *vulnerability_filter),
     file_name='nyc_heat_vulnerability_filtered.csv',
     mime='text/csv',
+    on_click='ignore',  # Downloading doesn't change anything, so skip the rerun
 )